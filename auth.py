@@ -5,21 +5,20 @@ TikTok OAuth 2.0 認可コードフローでアクセストークンを取得し
   uv run auth.py
 """
 
-import http.server
+import re
+import socket
 import urllib.parse
 import webbrowser
-import re
 
-import requests
-from dotenv import dotenv_values
+from envfile import ENV_FILE, load_env, save_tokens
+from http_client import SESSION
 
-ENV_FILE = ".env"
 PORT = 3000
 REDIRECT_URI = "https://fumifumi9999.github.io/TikTok_uploader/callback.html"
 
 
 def load_client_credentials() -> tuple[str, str]:
-    env = dotenv_values(ENV_FILE)
+    env = load_env()
     client_key = env.get("TIKTOK_CLIENT_KEY", "")
     client_secret = env.get("TIKTOK_CLIENT_SECRET", "")
     if not client_key or not client_secret:
@@ -28,7 +27,7 @@ def load_client_credentials() -> tuple[str, str]:
 
 
 def exchange_code(client_key: str, client_secret: str, code: str) -> dict:
-    resp = requests.post(
+    resp = SESSION.post(
         "https://open.tiktokapis.com/v2/oauth/token/",
         headers={"Content-Type": "application/x-www-form-urlencoded"},
         data={
@@ -43,27 +42,6 @@ def exchange_code(client_key: str, client_secret: str, code: str) -> dict:
     return resp.json()
 
 
-def save_env_value(key: str, value: str) -> None:
-    with open(ENV_FILE, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    pattern = rf"^#?\s*{key}=.*$"
-    replacement = f"{key}={value}"
-    if re.search(pattern, content, re.MULTILINE):
-        content = re.sub(pattern, replacement, content, flags=re.MULTILINE)
-    else:
-        content = content.rstrip("\n") + f"\n{replacement}\n"
-
-    with open(ENV_FILE, "w", encoding="utf-8") as f:
-        f.write(content)
-
-
-def save_tokens(token_data: dict) -> None:
-    save_env_value("TIKTOK_ACCESS_TOKEN", token_data["access_token"])
-    if "refresh_token" in token_data:
-        save_env_value("TIKTOK_REFRESH_TOKEN", token_data["refresh_token"])
-
-
 def main() -> None:
     client_key, client_secret = load_client_credentials()
 
@@ -83,10 +61,16 @@ def main() -> None:
 
     result = {}
 
-    class Handler(http.server.BaseHTTPRequestHandler):
-        def do_GET(self):
-            qs = urllib.parse.urlparse(self.path).query
-            params = urllib.parse.parse_qs(qs)
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("", PORT))
+        server.listen(1)
+        conn, _ = server.accept()  # 1リクエストだけ処理して終了
+        with conn:
+            # ヘッダー（Referer など）に含まれる ?code= を拾わないよう、リクエストラインだけを見る
+            request_line = conn.recv(8192).split(b"\r\n", 1)[0]
+            m = re.match(rb"GET [^? ]*\?(\S+) HTTP/", request_line)
+            params = urllib.parse.parse_qs(m.group(1).decode("ascii", "replace")) if m else {}
 
             if "code" in params:
                 code = params["code"][0]
@@ -114,16 +98,14 @@ def main() -> None:
                 msg = "不明なリクエスト"
                 print(f"\n{msg}")
 
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(f"<html><body><h2>{msg}</h2></body></html>".encode())
-
-        def log_message(self, format, *args):
-            pass  # ログ抑制
-
-    server = http.server.HTTPServer(("", PORT), Handler)
-    server.handle_request()  # 1リクエストだけ処理して終了
+            body = f"<html><body><h2>{msg}</h2></body></html>".encode()
+            conn.sendall(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/html; charset=utf-8\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
 
     if result.get("ok"):
         print("完了。uv run uploader.py 1.mp4 でアップロードできます。")
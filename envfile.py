@@ -0,0 +1,75 @@
+"""
+.env ファイルの読み書き。auth.py と uploader.py の両方から使う。
+"""
+
+import functools
+import os
+import re
+import tempfile
+import time
+
+from dotenv import dotenv_values, load_dotenv
+
+ENV_FILE = ".env"
+
+# .env の値を os.environ にも読み込んでおく（ACCESS_TOKEN などの環境変数フォールバック用）
+load_dotenv()
+
+_ENV_PATTERNS: dict[str, re.Pattern] = {}  # save_env_value() 用のキーごとのコンパイル済みパターン
+
+
+@functools.lru_cache(maxsize=1)
+def _parse_env(mtime_ns: int | None) -> dict[str, str | None]:
+    return dict(dotenv_values(ENV_FILE))
+
+
+def load_env() -> dict[str, str | None]:
+    """
+    .env の解析結果を返す。解析結果は .env の更新時刻ごとにキャッシュするので、
+    別プロセス（auth.py の再実行など）で書き換えられた場合も次の呼び出しで読み直す。
+    """
+    try:
+        mtime_ns = os.stat(ENV_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+    return _parse_env(mtime_ns)
+
+
+def save_env_value(key: str, value: str) -> None:
+    with open(ENV_FILE, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    pattern = _ENV_PATTERNS.get(key)
+    if pattern is None:
+        pattern = _ENV_PATTERNS[key] = re.compile(rf"^#?\s*{re.escape(key)}=.*$", re.MULTILINE)
+    replacement = f"{key}={value}"
+    if pattern.search(content):
+        # 置換文字列中の \ をグループ参照として解釈させない
+        content = pattern.sub(lambda _: replacement, content)
+    else:
+        content = content.rstrip("\n") + f"\n{replacement}\n"
+
+    # 一時ファイルに書いてから置き換え、書き込み途中で落ちても .env が壊れないようにする
+    tmp = tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=os.path.dirname(ENV_FILE) or ".", delete=False
+    )
+    try:
+        with tmp:
+            tmp.write(content)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp.name, ENV_FILE)
+    except BaseException:
+        # 秘密情報を含む一時ファイルを残さない
+        os.unlink(tmp.name)
+        raise
+    _parse_env.cache_clear()  # 更新時刻の分解能が粗いファイルシステムでも確実に読み直す
+
+
+def save_tokens(token_data: dict) -> None:
+    save_env_value("TIKTOK_ACCESS_TOKEN", token_data["access_token"])
+    if "refresh_token" in token_data:
+        save_env_value("TIKTOK_REFRESH_TOKEN", token_data["refresh_token"])
+    # 期限切れを事前に検知できるよう、有効期限（UNIX 秒）も保存する（expires_in が null でも既定値を使う）
+    expires_at = int(time.time()) + int(token_data.get("expires_in") or 86400)
+    save_env_value("TIKTOK_ACCESS_TOKEN_EXPIRES_AT", str(expires_at))
@@ -1,10 +1,11 @@
 """TikTok アップローダー GUI（Tkinter）"""
 
+import queue
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
 
-from uploader import upload_file, go_public
+from uploader import UploadCancelled, upload_file, go_public
 
 
 class App(tk.Tk):
@@ -14,6 +15,14 @@ class App(tk.Tk):
         self.geometry("480x260")
         self.resizable(False, False)
 
+        # アップロードはクリックごとにスレッドを作らず、常駐する1つのワーカーで実行する。
+        # daemon スレッドなのでウィンドウを閉じればアップロード中でも即座に終了する。
+        self._jobs = queue.Queue()
+        self._cancel = threading.Event()
+        self._closed = False
+        threading.Thread(target=self._worker, daemon=True).start()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
         self.video_path = tk.StringVar()
 
         # ファイル選択
@@ -31,9 +40,14 @@ class App(tk.Tk):
         tk.Radiobutton(frame_mode, text="インボックス送信", variable=self.mode, value="inbox").pack(side="left")
         tk.Radiobutton(frame_mode, text="直接公開", variable=self.mode, value="direct").pack(side="left", padx=(16, 0))
 
-        # アップロードボタン
-        self.btn_upload = tk.Button(self, text="アップロード", width=20, height=2, command=self._on_upload)
-        self.btn_upload.pack(pady=16)
+        # アップロード / キャンセルボタン
+        frame_buttons = tk.Frame(self)
+        frame_buttons.pack(pady=16)
+        self.btn_upload = tk.Button(frame_buttons, text="アップロード", width=20, height=2, command=self._on_upload)
+        self.btn_upload.pack(side="left")
+        self.btn_cancel = tk.Button(frame_buttons, text="キャンセル", width=10, height=2,
+                                    state="disabled", command=self._on_cancel)
+        self.btn_cancel.pack(side="left", padx=(8, 0))
 
         # ステータス表示
         self.status = tk.StringVar(value="動画を選択してください")
@@ -52,26 +66,61 @@ class App(tk.Tk):
             return
 
         self.btn_upload.config(state="disabled")
+        self.btn_cancel.config(state="normal")
         self.status.set("アップロード中...")
-        threading.Thread(target=self._do_upload, args=(path,), daemon=True).start()
+        self._cancel.clear()
+        self._jobs.put((path, self.mode.get()))
+
+    def _worker(self):
+        while True:
+            path, mode = self._jobs.get()
+            try:
+                publish_id = self._do_upload(path, mode)
+            except UploadCancelled:
+                self._post(self._on_cancelled)
+            except Exception as e:
+                self._post(self._on_error, str(e))
+            else:
+                self._post(self._on_success, publish_id)
+
+    def _do_upload(self, path: str, mode: str) -> str:
+        if mode == "direct":
+            return go_public(path, self._cancel)
+        return upload_file(path, self._cancel)
 
-    def _do_upload(self, path: str):
+    def _post(self, callback, *args):
+        """ワーカースレッドから結果をメインスレッドに渡す。ウィンドウを閉じた後は何もしない。"""
+        if self._closed:
+            return
         try:
-            if self.mode.get() == "direct":
-                publish_id = go_public(path)
-            else:
-                publish_id = upload_file(path)
-            self.after(0, self._on_success, publish_id)
-        except Exception as e:
-            self.after(0, self._on_error, str(e))
+            self.after(0, callback, *args)
+        except (tk.TclError, RuntimeError):
+            pass  # 閉じる処理と競合して Tk が破棄済み
+
+    def _on_cancel(self):
+        self._cancel.set()
+        self.btn_cancel.config(state="disabled")
+        self.status.set("キャンセル中（送信中のチャンクが終わると停止します）...")
+
+    def _on_close(self):
+        self._closed = True
+        self._cancel.set()
+        self.destroy()
 
     def _on_success(self, publish_id: str):
         self.btn_upload.config(state="normal")
+        self.btn_cancel.config(state="disabled")
         self.status.set(f"完了 (publish_id: {publish_id})")
         messagebox.showinfo("完了", f"アップロード完了\npublish_id: {publish_id}")
 
+    def _on_cancelled(self):
+        self.btn_upload.config(state="normal")
+        self.btn_cancel.config(state="disabled")
+        self.status.set("キャンセルしました")
+
     def _on_error(self, msg: str):
         self.btn_upload.config(state="normal")
+        self.btn_cancel.config(state="disabled")
         self.status.set("エラーが発生しました")
         messagebox.showerror("エラー", msg)
 
@@ -0,0 +1,26 @@
+"""
+TikTok API への HTTP リクエストで共有する requests.Session。
+
+チャンクごとに TCP/TLS 接続を張り直さないよう、auth.py と uploader.py の
+全リクエストをこのセッション経由で送る。
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        # 一時的なゲートウェイエラーのみ再試行（POST は urllib3 の既定で再試行しない）
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,  # 再試行後の最終レスポンスは呼び出し側のステータス確認に渡す
+        ),
+    ),
+)
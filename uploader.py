@@ -11,40 +11,43 @@ TikTok Content Posting API でローカルの MP4 をアップロードするス
 """
 
 import argparse
+import mmap
 import os
+import stat
 import sys
+import threading
+import time
 
 import requests
 
+from envfile import load_env, save_tokens
+from http_client import SESSION
+
 # チャンク制約: 5MB〜64MB（最終チャンクは最大128MB）
 CHUNK_MIN_BYTES = 5 * 1024 * 1024   # 5 MB
 CHUNK_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
 CHUNK_DEFAULT_BYTES = 10 * 1024 * 1024  # 10 MB
+LARGE_FILE_BYTES = 256 * 1024 * 1024  # 256 MB: これ以上のファイルは最大チャンクで送る
 MAX_CHUNKS = 1000
+TOKEN_REFRESH_MARGIN_SEC = 60  # 有効期限のこの秒数前からトークンを事前更新する
 INIT_API = "https://open.tiktokapis.com/v2/post/publish/inbox/video/init/"
 DIRECT_POST_API = "https://open.tiktokapis.com/v2/post/publish/video/init/"
 
 
-
-# .env ファイルから環境変数を読み込むために dotenv を使う
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass  # dotenv が無ければ何もしない（グレースフルデグレード）
+class UploadCancelled(Exception):
+    """cancel_event によってアップロードが中断されたことを表す。"""
 
 
 def refresh_access_token() -> str | None:
     """refresh_token を使って新しい access_token を取得し .env に保存する。"""
-    from dotenv import dotenv_values
-    env = dotenv_values('.env')
+    env = load_env()
     refresh_token = env.get("TIKTOK_REFRESH_TOKEN")
     client_key = env.get("TIKTOK_CLIENT_KEY")
     client_secret = env.get("TIKTOK_CLIENT_SECRET")
     if not refresh_token or not client_key or not client_secret:
         return None
 
-    resp = requests.post(
+    resp = SESSION.post(
         "https://open.tiktokapis.com/v2/oauth/token/",
         headers={"Content-Type": "application/x-www-form-urlencoded"},
         data={
@@ -60,18 +63,23 @@ def refresh_access_token() -> str | None:
     if not new_token:
         return None
 
-    from auth import save_env_value
-    save_env_value("TIKTOK_ACCESS_TOKEN", new_token)
-    if "refresh_token" in data:
-        save_env_value("TIKTOK_REFRESH_TOKEN", data["refresh_token"])
+    save_tokens(data)
     print("トークンを自動更新しました。")
     return new_token
 
 
 def get_access_token() -> str:
-    from dotenv import dotenv_values
-    env = dotenv_values('.env')
+    env = load_env()
     token = env.get("TIKTOK_ACCESS_TOKEN") or os.environ.get("TIKTOK_ACCESS_TOKEN") or os.environ.get("ACCESS_TOKEN")
+    expires_at = env.get("TIKTOK_ACCESS_TOKEN_EXPIRES_AT") or ""
+    if env.get("TIKTOK_ACCESS_TOKEN") and expires_at.isdigit() and time.time() >= int(expires_at) - TOKEN_REFRESH_MARGIN_SEC:
+        # 期限切れ間近なら初期化リクエストを無駄にする前に更新しておく
+        print("アクセストークンの有効期限が近いため更新します...")
+        try:
+            token = refresh_access_token() or token
+        except (requests.RequestException, ValueError) as e:
+            # 現在のトークンはまだ有効なので、更新に失敗してもそのまま使う
+            print(f"トークンの事前更新に失敗しました（現在のトークンを使用します）: {e}", file=sys.stderr)
     if not token:
         print("エラー: TIKTOK_ACCESS_TOKEN または ACCESS_TOKEN を設定してください。", file=sys.stderr)
         sys.exit(1)
@@ -83,30 +91,35 @@ def calc_chunk_params(file_size: int) -> tuple[int, int]:
     ファイルサイズから chunk_size と total_chunk_count を計算する。
     TikTok API仕様: total_chunk_count = floor(video_size / chunk_size)
     最終チャンクに端数が加算される（最大128MBまで許容）。
+    大きいファイルはリクエスト数を減らすため 64MB チャンクを使う。
     """
     if file_size <= CHUNK_MAX_BYTES:
         return file_size, 1
-    chunk_size = CHUNK_DEFAULT_BYTES  # 10 MB
+    if file_size >= LARGE_FILE_BYTES:
+        chunk_size = CHUNK_MAX_BYTES  # 64 MB
+    else:
+        chunk_size = CHUNK_DEFAULT_BYTES  # 10 MB
     total_chunk_count = file_size // chunk_size  # floor除算（TikTok API仕様）
+    if total_chunk_count > MAX_CHUNKS:
+        raise ValueError(f"ファイルが大きすぎます（{MAX_CHUNKS} チャンクを超えます）")
     return chunk_size, total_chunk_count
 
 
-def init_upload(video_size: int, chunk_size: int, total_chunk_count: int) -> tuple[str, str]:
-    """アップロード初期化。publish_id と upload_url を返す。"""
+def calc_chunk_ranges(file_size: int, chunk_size: int, total_chunk_count: int) -> list[tuple[int, int]]:
+    """各チャンクの (first_byte, last_byte) を返す。最終チャンクは残り全バイトを含む。"""
+    ranges = [(i * chunk_size, (i + 1) * chunk_size - 1) for i in range(total_chunk_count - 1)]
+    ranges.append(((total_chunk_count - 1) * chunk_size, file_size - 1))
+    return ranges
+
+
+def _post_init(api_url: str, body: dict) -> tuple[str, str]:
+    """初期化 API を呼び出し、publish_id と upload_url を返す。"""
     access_token = get_access_token()
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json; charset=UTF-8",
     }
-    body = {
-        "source_info": {
-            "source": "FILE_UPLOAD",
-            "video_size": video_size,
-            "chunk_size": chunk_size,
-            "total_chunk_count": total_chunk_count,
-        }
-    }
-    resp = requests.post(INIT_API, headers=headers, json=body, timeout=30)
+    resp = SESSION.post(api_url, headers=headers, json=body, timeout=30)
     data = resp.json()
 
     err = data.get("error", {})
@@ -123,7 +136,20 @@ def init_upload(video_size: int, chunk_size: int, total_chunk_count: int) -> tup
     return publish_id, upload_url
 
 
-def upload_chunk(upload_url: str, data: bytes, first_byte: int, last_byte: int, total_size: int) -> int:
+def init_upload(video_size: int, chunk_size: int, total_chunk_count: int) -> tuple[str, str]:
+    """アップロード初期化。publish_id と upload_url を返す。"""
+    body = {
+        "source_info": {
+            "source": "FILE_UPLOAD",
+            "video_size": video_size,
+            "chunk_size": chunk_size,
+            "total_chunk_count": total_chunk_count,
+        }
+    }
+    return _post_init(INIT_API, body)
+
+
+def upload_chunk(upload_url: str, data: bytes | memoryview, first_byte: int, last_byte: int, total_size: int) -> int:
     """
     1チャンクを PUT で送信。期待される HTTP ステータスは 206（継続）または 201（完了）。
     返り値はレスポンスの Content-Range から得たアップロード済みバイト数（last_byte + 1）。
@@ -133,7 +159,7 @@ def upload_chunk(upload_url: str, data: bytes, first_byte: int, last_byte: int,
         "Content-Length": str(len(data)),
         "Content-Range": f"bytes {first_byte}-{last_byte}/{total_size}",
     }
-    resp = requests.put(upload_url, headers=headers, data=data, timeout=120)
+    resp = SESSION.put(upload_url, headers=headers, data=data, timeout=120)
     if resp.status_code not in (206, 201):
         raise RuntimeError(f"アップロード失敗: HTTP {resp.status_code} - {resp.text[:500]}")
 
@@ -147,16 +173,62 @@ def upload_chunk(upload_url: str, data: bytes, first_byte: int, last_byte: int,
     return last_byte + 1
 
 
-def upload_file(path: str) -> str:
+def _madvise(mm: mmap.mmap, advice: str, start: int = 0, length: int | None = None) -> None:
     """
-    ローカル MP4 を TikTok Content Posting API でアップロードする。
-    戻り値: publish_id（ステータス確認用）。
+    mmap.madvise が使える環境（Linux / macOS）でのみカーネルに先読みのヒントを渡す。
+    length を省略するとマッピング全体が対象（length=0 を明示すると何もしないため渡さない）。
+    """
+    if not hasattr(mm, "madvise") or not hasattr(mmap, advice):
+        return
+    if length is None:
+        mm.madvise(getattr(mmap, advice))
+    else:
+        mm.madvise(getattr(mmap, advice), start, length)
+
+
+def send_chunks(upload_url: str, path: str, file_size: int, chunk_size: int, total_chunk_count: int,
+                cancel_event: threading.Event | None = None) -> None:
+    """
+    全チャンクを送信する。
+    TikTok はチャンクを先頭から順番に受け付けるため PUT は順番に行う。
+    ファイルは一度だけ mmap し、各チャンクはその memoryview スライスとして渡すので
+    Python 側で bytes へのコピーは発生しない（読み込みはページキャッシュから直接送信される）。
+    cancel_event がセットされると次のチャンクを送る前に UploadCancelled で中断する。
+    """
+    ranges = calc_chunk_ranges(file_size, chunk_size, total_chunk_count)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        _madvise(mm, "MADV_SEQUENTIAL")
+        # 送信中のチャンクの次のチャンクを先読みさせ、ディスク読み込みを送信と重ねる
+        # （chunk_size はページ境界の倍数なので各チャンクの先頭はページ境界に揃う）
+        first_start, first_end = ranges[0]
+        _madvise(mm, "MADV_WILLNEED", first_start, first_end - first_start + 1)
+        # mmap を閉じる前に全 memoryview を release する必要があるので with で管理する
+        with memoryview(mm) as view:
+            for i, (start, end) in enumerate(ranges):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise UploadCancelled("アップロードをキャンセルしました")
+                if i + 1 < len(ranges):
+                    next_start, next_end = ranges[i + 1]
+                    _madvise(mm, "MADV_WILLNEED", next_start, next_end - next_start + 1)
+                with view[start:end + 1] as chunk_data:
+                    upload_chunk(upload_url, chunk_data, start, end, file_size)
+                print(f"  チャンク {i + 1}/{total_chunk_count} 送信済み (bytes {start}-{end})")
+
+
+def _upload_stream(path: str, init_fn, cancel_event: threading.Event | None = None) -> str:
+    """
+    ファイルを検証し、init_fn(video_size, chunk_size, total_chunk_count) で初期化してから全チャンクを送信する。
+    初期化がトークン期限切れで失敗した場合はリフレッシュして1回だけ再試行する。戻り値: publish_id。
     """
     path = os.path.abspath(path)
-    if not os.path.isfile(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         raise FileNotFoundError(f"ファイルが見つかりません: {path}")
 
-    file_size = os.path.getsize(path)
+    file_size = st.st_size
     if file_size <= 0:
         raise ValueError("空のファイルはアップロードできません")
 
@@ -165,30 +237,29 @@ def upload_file(path: str) -> str:
     print(f"チャンク: {chunk_size:,} bytes × {total_chunk_count} リクエスト")
 
     try:
-        publish_id, upload_url = init_upload(file_size, chunk_size, total_chunk_count)
+        publish_id, upload_url = init_fn(file_size, chunk_size, total_chunk_count)
     except RuntimeError as e:
         if "access_token" in str(e).lower() or "invalid" in str(e).lower() or "expired" in str(e).lower():
             print("トークン期限切れの可能性があります。リフレッシュを試みます...")
             new_token = refresh_access_token()
             if new_token:
-                publish_id, upload_url = init_upload(file_size, chunk_size, total_chunk_count)
+                publish_id, upload_url = init_fn(file_size, chunk_size, total_chunk_count)
             else:
                 raise RuntimeError("トークンの自動更新に失敗しました。uv run auth.py で再認証してください。") from e
         else:
             raise
     print(f"初期化完了 publish_id={publish_id}")
 
-    with open(path, "rb") as f:
-        for i in range(total_chunk_count):
-            start = i * chunk_size
-            if i == total_chunk_count - 1:
-                chunk_data = f.read()  # 最終チャンク: 残り全バイト
-            else:
-                chunk_data = f.read(chunk_size)
-            end = start + len(chunk_data) - 1
-            upload_chunk(upload_url, chunk_data, start, end, file_size)
-            print(f"  チャンク {i + 1}/{total_chunk_count} 送信済み (bytes {start}-{end})")
+    send_chunks(upload_url, path, file_size, chunk_size, total_chunk_count, cancel_event)
+    return publish_id
+
 
+def upload_file(path: str, cancel_event: threading.Event | None = None) -> str:
+    """
+    ローカル MP4 を TikTok Content Posting API でアップロードする。
+    戻り値: publish_id（ステータス確認用）。
+    """
+    publish_id = _upload_stream(path, init_upload, cancel_event)
     print("アップロード完了。TikTok のインボックスで編集・投稿を完了してください。")
     return publish_id
 
@@ -196,11 +267,6 @@ def upload_file(path: str) -> str:
 def init_direct_post(video_size: int, chunk_size: int, total_chunk_count: int,
                      post_info: dict) -> tuple[str, str]:
     """Direct Post 初期化。publish_id と upload_url を返す。"""
-    access_token = get_access_token()
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json; charset=UTF-8",
-    }
     body = {
         "post_info": post_info,
         "source_info": {
@@ -210,24 +276,10 @@ def init_direct_post(video_size: int, chunk_size: int, total_chunk_count: int,
             "total_chunk_count": total_chunk_count,
         },
     }
-    resp = requests.post(DIRECT_POST_API, headers=headers, json=body, timeout=30)
-    data = resp.json()
-
-    err = data.get("error", {})
-    if err.get("code") != "ok":
-        msg = err.get("message", resp.text)
-        raise RuntimeError(f"初期化失敗: {err.get('code', 'unknown')} - {msg}")
-
-    info = data.get("data", {})
-    publish_id = info.get("publish_id")
-    upload_url = info.get("upload_url")
-    if not publish_id or not upload_url:
-        raise RuntimeError("レスポンスに publish_id または upload_url がありません")
+    return _post_init(DIRECT_POST_API, body)
 
-    return publish_id, upload_url
 
-
-def go_public(path: str) -> str:
+def go_public(path: str, cancel_event: threading.Event | None = None) -> str:
     """ローカル MP4 を TikTok に直接公開する。戻り値: publish_id。"""
     # --- 動画パラメータ（ここを編集して投稿設定を変更） ---
     title = "千葉に住んでいる宇宙人から来た存在 #shorts #雑学"  # 動画のタイトル/説明文
@@ -251,44 +303,14 @@ def go_public(path: str) -> str:
         "brand_organic_toggle": brand_organic_toggle,
     }
 
-    path = os.path.abspath(path)
-    if not os.path.isfile(path):
-        raise FileNotFoundError(f"ファイルが見つかりません: {path}")
-
-    file_size = os.path.getsize(path)
-    if file_size <= 0:
-        raise ValueError("空のファイルはアップロードできません")
-
-    chunk_size, total_chunk_count = calc_chunk_params(file_size)
-    print(f"ファイル: {path} ({file_size:,} bytes)")
-    print(f"チャンク: {chunk_size:,} bytes × {total_chunk_count} リクエスト")
-    print(f"モード: 直接公開 (Direct Post)")
-
-    try:
-        publish_id, upload_url = init_direct_post(file_size, chunk_size, total_chunk_count, post_info)
-    except RuntimeError as e:
-        if "access_token" in str(e).lower() or "invalid" in str(e).lower() or "expired" in str(e).lower():
-            print("トークン期限切れの可能性があります。リフレッシュを試みます...")
-            new_token = refresh_access_token()
-            if new_token:
-                publish_id, upload_url = init_direct_post(file_size, chunk_size, total_chunk_count, post_info)
-            else:
-                raise RuntimeError("トークンの自動更新に失敗しました。uv run auth.py で再認証してください。") from e
-        else:
-            raise
-    print(f"初期化完了 publish_id={publish_id}")
-
-    with open(path, "rb") as f:
-        for i in range(total_chunk_count):
-            start = i * chunk_size
-            if i == total_chunk_count - 1:
-                chunk_data = f.read()  # 最終チャンク: 残り全バイト
-            else:
-                chunk_data = f.read(chunk_size)
-            end = start + len(chunk_data) - 1
-            upload_chunk(upload_url, chunk_data, start, end, file_size)
-            print(f"  チャンク {i + 1}/{total_chunk_count} 送信済み (bytes {start}-{end})")
-
+    print("モード: 直接公開 (Direct Post)")
+    publish_id = _upload_stream(
+        path,
+        lambda video_size, chunk_size, total_chunk_count: init_direct_post(
+            video_size, chunk_size, total_chunk_count, post_info
+        ),
+        cancel_event,
+    )
     print("直接公開完了。TikTok に投稿されました。")
     return publish_id
 